@@ -1,102 +1,138 @@
 import numpy as np
 import random
+from functools import lru_cache
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
 from collections import Counter
 
+try:
+    import protein_kernels # Numba-compiled kernels, needed for backend='numba' and parallel_tempering
+except ImportError:
+    protein_kernels = None
+
+try:
+    import sa_core # Optional AOT-compiled kernel, built with `python setup.py build_ext --inplace`
+except ImportError:
+    sa_core = None
+
 # --- 1. HP Model Setup ---
 
+@lru_cache(maxsize=None)
 def parse_sequence(sequence_str):
-    """Converts a string like 'PHPH' into a list of 0s (P) and 1s (H)."""
-    return [1 if char == 'H' else 0 for char in sequence_str.upper()]
+    """
+    Converts a string like 'PHPH' into an int8 array of 0s (P) and 1s (H).
+    Results are cached per sequence and returned read-only, since callers share the same array.
+    """
+    # One byte per character: non-ASCII characters become '?' (so P) instead of multi-byte UTF-8
+    sequence_bytes = sequence_str.encode('ascii', 'replace').upper()
+    protein_sequence_hp = (np.frombuffer(sequence_bytes, dtype=np.uint8) == ord('H')).astype(np.int8)
+    protein_sequence_hp.flags.writeable = False
+    return protein_sequence_hp
+
+# (dx, dy) offsets of the adjacent cells on a 2D square lattice.
+# protein_kernels keeps a copy in the same order for the compiled kernels; added inline so no neighbor lists are allocated.
+_OFFSETS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+def pack(x, y):
+    """Packs a lattice coordinate into a single int key, so sets and dicts hash ints instead of tuples."""
+    return (x << 16) | (y & 0xFFFF)
 
-def get_neighbors(x, y):
-    """Returns the (x, y) coordinates of adjacent cells on a 2D square lattice."""
-    return [(x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)]
+def pack_coords(xs, ys):
+    """Packs int16 coordinate arrays into int32 keys, one unique key per lattice site (same layout as pack)."""
+    return (xs.astype(np.int32) << 16) | (ys.astype(np.int32) & 0xFFFF)
 
-def calculate_energy(protein_sequence_hp, protein_path):
+def calculate_energy(protein_sequence_hp, xs, ys):
     """
     Calculates the energy of a protein configuration based on the HP model.
     Energy is the negative count of non-bonded H-H contacts.
+    The configuration is given as parallel int16 arrays of x and y coordinates.
+    Contacts are found with a vectorized lookup of each H residue's neighbors among the sorted H keys.
     """
-    energy = 0
-    num_residues = len(protein_sequence_hp)
-    
-    # Create a set of H-residue coordinates for quick lookup
-    h_coords = set()
-    for i in range(num_residues):
-        if protein_sequence_hp[i] == 1: # Is an 'H' residue
-            h_coords.add(protein_path[i])
-
-    # Check for H-H contacts
-    for i in range(num_residues):
-        if protein_sequence_hp[i] == 1: # Only 'H' residues contribute to contacts
-            current_h_coord = protein_path[i]
-            
-            for neighbor_coord in get_neighbors(current_h_coord[0], current_h_coord[1]):
-                # Check if the neighbor is also an 'H' residue
-                if neighbor_coord in h_coords:
-                    # Find the index of the neighboring H residue
-                    neighbor_idx = protein_path.index(neighbor_coord)
-                    
-                    # Ensure it's a non-bonded contact:
-                    # - The neighbor_idx must be greater than current_idx to avoid double counting
-                    # - They must not be consecutive in the primary sequence (|i - neighbor_idx| > 1)
-                    if neighbor_idx > i and abs(i - neighbor_idx) > 1:
-                        energy -= 1 # Each H-H contact contributes -1 energy
-    return energy
-
-def is_valid_path(path):
+    h_idx = np.flatnonzero(np.asarray(protein_sequence_hp) == 1) # Only 'H' residues contribute to contacts
+    if h_idx.size == 0:
+        return 0
+    h_xs, h_ys = xs[h_idx], ys[h_idx]
+
+    # Sorted packed H coordinates, so neighbors can be located with a binary search
+    h_keys = pack_coords(h_xs, h_ys)
+    order = np.argsort(h_keys)
+    sorted_keys = h_keys[order]
+
+    contacts = 0
+    for dx, dy in _OFFSETS:
+        neighbor_keys = pack_coords(h_xs + dx, h_ys + dy)
+        pos = np.minimum(np.searchsorted(sorted_keys, neighbor_keys), sorted_keys.size - 1)
+        hits = sorted_keys[pos] == neighbor_keys
+        neighbor_idx = h_idx[order[pos[hits]]]
+        # Count each non-bonded pair once, from the lower index
+        contacts += np.count_nonzero(neighbor_idx > h_idx[hits] + 1)
+    return -contacts # Each H-H contact contributes -1 energy
+
+def is_valid_path(xs, ys):
     """
     Checks if a given protein path is valid:
-    1. No self-intersections (each coordinate is unique).
-    2. Maintains connectivity (adjacent residues in sequence are adjacent on lattice).
+    1. Maintains connectivity (adjacent residues in sequence are adjacent on lattice).
+    2. No self-intersections (each coordinate is unique).
+    Both checks are single vectorized passes over the coordinate arrays.
     """
-    # 1. No self-intersections
-    if len(set(path)) != len(path):
+    # 1. Maintains connectivity (Manhattan distance of 1 between consecutive residues)
+    steps = np.abs(np.diff(xs)) + np.abs(np.diff(ys))
+    if not (steps == 1).all():
         return False
-    
-    # 2. Maintains connectivity
-    for i in range(len(path) - 1):
-        x1, y1 = path[i]
-        x2, y2 = path[i+1]
-        
-        # Check if they are adjacent (Manhattan distance of 1)
-        if abs(x1 - x2) + abs(y1 - y2) != 1:
-            return False
-            
-    return True
 
-def generate_random_path(num_residues):
+    # 2. No self-intersections
+    return np.unique(pack_coords(xs, ys)).size == xs.size
+
+def generate_random_path(num_residues, rng=random):
     """
     Generates a random, valid initial path for the protein on a 2D lattice.
-    Starts at (0,0) and randomly moves in allowed directions.
+    Starts at (0,0) and randomly moves in allowed directions, backtracking out of dead ends.
+    A walk that needs more than num_residues backtracks has most likely sealed itself into
+    a large pocket, so it is abandoned and a fresh walk is started.
+    `rng` is a random.Random (or the random module) used for the walk, so callers can seed it.
+    Returns the path as parallel int16 arrays (xs, ys).
     """
-    path = [(0, 0)]
-    current_x, current_y = 0, 0
+    while True:
+        path = [(0, 0)]
+        occupied = {pack(0, 0)} # Packed coordinates already on the path
+
+        def shuffled_free_moves(x, y):
+            # Moves that would not cause a self-intersection, in random order
+            moves = [(x + dx, y + dy) for dx, dy in _OFFSETS if pack(x + dx, y + dy) not in occupied]
+            rng.shuffle(moves)
+            return moves
+
+        # untried_moves[k] holds the moves not yet tried from path[k]
+        untried_moves = [shuffled_free_moves(0, 0)]
+        backtracks = 0
+
+        while len(path) < num_residues and backtracks <= num_residues:
+            if untried_moves[-1]:
+                next_x, next_y = untried_moves[-1].pop()
+                path.append((next_x, next_y))
+                occupied.add(pack(next_x, next_y))
+                untried_moves.append(shuffled_free_moves(next_x, next_y))
+            else:
+                # Stuck: step back and try another move from the previous residue
+                untried_moves.pop()
+                occupied.remove(pack(*path.pop()))
+                backtracks += 1
 
-    for _ in range(num_residues - 1):
-        possible_next_coords = get_neighbors(current_x, current_y)
-        
-        # Filter out moves that would cause a self-intersection
-        valid_moves = [move for move in possible_next_coords if move not in path]
-        
-        if not valid_moves:
-            # If no valid moves, it means we're stuck.
-            # For robustness, could restart or implement more complex backtracking.
-            # For simplicity, if stuck, we return a "bad" path that won't be valid.
-            return [] 
-
-        next_x, next_y = random.choice(valid_moves)
-        path.append((next_x, next_y))
-        current_x, current_y = next_x, next_y
+        if len(path) >= num_residues:
+            break
         
-    return path
+    xs = np.array([p[0] for p in path], dtype=np.int16)
+    ys = np.array([p[1] for p in path], dtype=np.int16)
+    return xs, ys
 
 # --- 2. Simulated Annealing Algorithm ---
 
-def simulated_annealing(sequence_str, initial_temperature, final_temperature, cooling_rate, steps_per_temp):
+def simulated_annealing(sequence_str, initial_temperature, final_temperature, cooling_rate, steps_per_temp, seed=None,
+                        backend="numba"):
     """
     Performs Simulated Annealing to find a low-energy protein configuration.
+    The annealing loop itself runs in the Numba-compiled protein_kernels.sa_kernel, or in the sa_core
+    C extension if requested; the 'cython' backend does not need Numba installed.
     
     Args:
         sequence_str (str): The HP sequence (e.g., 'PHPH').
@@ -104,148 +140,129 @@ def simulated_annealing(sequence_str, initial_temperature, final_temperature, co
         final_temperature (float): Ending temperature.
         cooling_rate (float): Multiplicative factor for cooling (e.g., 0.99).
         steps_per_temp (int): Number of attempted moves at each temperature.
+        seed (int, optional): Seed for the initial path and the kernel's random number generator.
+        backend (str): 'numba' for protein_kernels.sa_kernel, or 'cython' for the sa_core extension (must be built and
+            rebuilt after editing sa_core.pyx). The two kernels use different random number generators,
+            so the same seed gives different results on each backend.
         
     Returns:
-        tuple: (best_path, best_energy, energy_history)
+        tuple: (best_xs, best_ys, best_energy, energy_history)
     """
+    if backend == "numba":
+        if protein_kernels is None:
+            raise ImportError("backend='numba' needs numba: pip install numba, or use backend='cython'")
+        kernel = protein_kernels.sa_kernel
+    elif backend == "cython":
+        if sa_core is None:
+            raise ImportError("backend='cython' needs the sa_core extension: python setup.py build_ext --inplace")
+        kernel = sa_core.sa_kernel
+    else:
+        raise ValueError(f"Unknown backend {backend!r}, expected 'numba' or 'cython'")
+
     protein_sequence_hp = parse_sequence(sequence_str)
     num_residues = len(protein_sequence_hp)
 
+    if seed is None:
+        seed = random.randrange(2**31)
+    rng = random.Random(seed)
+    kernel_seed = seed % 2**32 # np.random.seed only takes 32-bit seeds; random.Random takes any int
+
     # Initialize with a random valid path
-    current_path = []
-    while not current_path: # Keep trying until a valid path is generated
-        current_path = generate_random_path(num_residues)
-        if not current_path:
-             print("Warning: Could not generate a valid initial path. Trying again...")
+    current_xs, current_ys = generate_random_path(num_residues, rng)
 
-    current_energy = calculate_energy(protein_sequence_hp, current_path)
-    
-    best_path = list(current_path)
-    best_energy = current_energy
+    current_energy = calculate_energy(protein_sequence_hp, current_xs, current_ys)
+    print(f"Initial path: {list(zip(current_xs.tolist(), current_ys.tolist()))}, Initial energy: {current_energy}")
+
+    best_xs, best_ys, best_energy, energy_history = kernel(
+        protein_sequence_hp, current_xs, current_ys,
+        initial_temperature, final_temperature, cooling_rate, steps_per_temp, kernel_seed
+    )
+    return best_xs, best_ys, int(best_energy), energy_history
+
+def parallel_tempering(sequence_str, cold_temperature, hot_temperature, n_replicas=10, sweeps=1000, swap_every=100, seed=None):
+    """
+    Performs Parallel Tempering (replica exchange) to find a low-energy protein configuration.
+    Replicas at geometrically spaced temperatures run in parallel and periodically swap
+    configurations, letting hot replicas carry cold ones out of local minima.
     
-    energy_history = []
-    temperature = initial_temperature
-
-    print(f"Initial path: {current_path}, Initial energy: {current_energy}")
-
-    while temperature > final_temperature:
-        for _ in range(steps_per_temp):
-            # Propose a new configuration (a "move")
-            new_path = list(current_path) # Start with current path
-            
-            # Common moves for HP model:
-            # 1. End-move: Move one end of the chain (if it doesn't self-intersect)
-            # 2. Corner-move: Move a corner (3 residues)
-            # 3. Crankshaft-move: Rotate a segment of the chain
-            
-            # For simplicity, let's implement a "random single-residue move"
-            # This is more like a Monte Carlo step where we try to move *any* residue
-            # but maintain connectivity and non-intersection.
-            # A more sophisticated SA would use specific, well-defined moves.
-            
-            # Choose a random residue (not the first or last for simplicity of moves)
-            # In real SA, moves are carefully designed to explore conformational space
-            # and maintain connectivity. Here's a very simple 'pivot' type move.
-            
-            if num_residues < 3: # Need at least 3 for complex moves, so simplify for tiny chains
-                # For very small chains, just regenerate a new random valid path
-                proposed_path = generate_random_path(num_residues)
-                
-            else:
-                # Attempt a pivot move: pick a random residue (not ends) and try to rotate part
-                # This is a very rough implementation of a pivot for illustration.
-                pivot_idx = random.randint(1, num_residues - 2) # Exclude ends
-                pivot_x, pivot_y = current_path[pivot_idx]
-
-                # Identify the segment to rotate (e.g., from pivot to end)
-                segment_to_rotate = current_path[pivot_idx:]
-                
-                # Try simple 90-degree rotations around the pivot
-                # This is highly simplified for demonstration!
-                
-                rotated_segment = []
-                # Relative coordinates to pivot
-                relative_coords = [(cx - pivot_x, cy - pivot_y) for cx, cy in segment_to_rotate]
-
-                # Rotate 90 degrees clockwise (x,y -> y,-x)
-                rotated_relative = [(y, -x) for x, y in relative_coords]
-                
-                # Translate back
-                for i, (rx, ry) in enumerate(rotated_relative):
-                    # For first element of rotated segment, it's the pivot itself
-                    if i == 0:
-                        rotated_segment.append((pivot_x, pivot_y))
-                    else:
-                        rotated_segment.append((pivot_x + rx, pivot_y + ry))
-
-                # Assemble the proposed path
-                proposed_path = current_path[:pivot_idx] + rotated_segment
-            
-            if not is_valid_path(proposed_path):
-                # If the proposed move creates an invalid path (self-intersection, broken bond), skip it
-                continue
-                
-            proposed_energy = calculate_energy(protein_sequence_hp, proposed_path)
-
-            # Decide whether to accept the new configuration
-            # Metropolis criterion
-            delta_e = proposed_energy - current_energy
-            if delta_e < 0: # New state is better
-                current_path = list(proposed_path)
-                current_energy = proposed_energy
-            elif temperature > 0: # New state is worse, but accept with some probability
-                acceptance_probability = np.exp(-delta_e / temperature)
-                if random.random() < acceptance_probability:
-                    current_path = list(proposed_path)
-                    current_energy = proposed_energy
-            
-            # Update best found so far
-            if current_energy < best_energy:
-                best_energy = current_energy
-                best_path = list(current_path)
-
-        energy_history.append((temperature, current_energy))
-        temperature *= cooling_rate # Cool down
-
-    return best_path, best_energy, energy_history
+    Args:
+        sequence_str (str): The HP sequence (e.g., 'PHPH').
+        cold_temperature (float): Temperature of the coldest replica.
+        hot_temperature (float): Temperature of the hottest replica.
+        n_replicas (int): Number of replicas (at least 2).
+        sweeps (int): Number of swap intervals.
+        swap_every (int): Number of attempted moves per replica between swap attempts.
+        seed (int, optional): Seed for the replicas' initial paths and the kernel's random number generators.
+            The same seed reproduces a run whatever the number of Numba threads.
+        
+    Returns:
+        tuple: (best_xs, best_ys, best_energy, replica_energies) where replica_energies is a
+        (sweeps, n_replicas) array of the energy at each temperature (hottest first) after every sweep.
+        Unlike the (temperature, energy) rows returned by simulated_annealing, it cannot be passed
+        to plot_energy_history.
+    """
+    if protein_kernels is None:
+        raise ImportError("parallel_tempering needs numba: pip install numba")
+    if cold_temperature <= 0 or hot_temperature <= 0:
+        raise ValueError("cold_temperature and hot_temperature must be positive")
+    if n_replicas < 2:
+        raise ValueError("parallel_tempering needs at least 2 replicas; use simulated_annealing for a single chain")
+
+    protein_sequence_hp = parse_sequence(sequence_str)
+    num_residues = len(protein_sequence_hp)
+
+    # Geometric spacing in inverse temperature: beta_i = beta_min * (beta_max / beta_min) ** (i / (n - 1))
+    betas = np.geomspace(1.0 / hot_temperature, 1.0 / cold_temperature, n_replicas)
+    temperatures = 1.0 / betas
+
+    if seed is None:
+        seed = random.randrange(2**31)
+    rng = random.Random(seed)
+    kernel_seed = seed % 2**32 # np.random.seed only takes 32-bit seeds; random.Random takes any int
+
+    replica_xs = np.empty((n_replicas, num_residues), dtype=np.int16)
+    replica_ys = np.empty((n_replicas, num_residues), dtype=np.int16)
+    for r in range(n_replicas):
+        replica_xs[r], replica_ys[r] = generate_random_path(num_residues, rng)
+
+    best_xs, best_ys, best_energy, replica_energies = protein_kernels.pt_kernel(
+        protein_sequence_hp, replica_xs, replica_ys, temperatures, sweeps, swap_every, kernel_seed
+    )
+    return best_xs, best_ys, int(best_energy), replica_energies
 
 # --- 3. Visualization ---
 
-def plot_protein(sequence_str, path, energy, title="Protein Fold"):
+def plot_protein(sequence_str, xs, ys, energy, title="Protein Fold"):
     """
     Plots the 2D protein fold.
     """
     protein_sequence_hp = parse_sequence(sequence_str)
-    
-    # Extract coordinates
-    x_coords = [p[0] for p in path]
-    y_coords = [p[1] for p in path]
-
-    plt.figure(figsize=(6, 6))
-    plt.plot(x_coords, y_coords, 'k-') # Draw the backbone
-
-    for i, (x, y) in enumerate(path):
-        color = 'red' if protein_sequence_hp[i] == 1 else 'blue' # H is red, P is blue
-        label = 'H' if protein_sequence_hp[i] == 1 else 'P'
-        plt.plot(x, y, 'o', markersize=10, color=color, label=label if i == 0 else "")
-        plt.text(x + 0.1, y + 0.1, str(i), fontsize=8) # Label residues with their index
-
-    # Draw H-H contacts (non-bonded)
-    h_coords = set()
-    for i in range(len(protein_sequence_hp)):
-        if protein_sequence_hp[i] == 1:
-            h_coords.add(path[i])
+    x_coords, y_coords = xs.tolist(), ys.tolist()
+    coords = np.stack([xs, ys], axis=1)
+
+    fig, ax = plt.subplots(figsize=(6, 6))
+
+    # Draw the backbone as one collection of bond segments
+    ax.add_collection(LineCollection(np.stack([coords[:-1], coords[1:]], axis=1), colors='k'))
+
+    # Draw all residues in a single scatter: H is red, P is blue
+    colors = np.where(protein_sequence_hp == 1, 'red', 'blue')
+    ax.scatter(xs, ys, c=colors, s=100, zorder=3)
+    if len(x_coords) <= 50: # Labels become unreadable clutter on long chains
+        for i, (x, y) in enumerate(zip(x_coords, y_coords)):
+            ax.text(x + 0.1, y + 0.1, str(i), fontsize=8) # Label residues with their index
 
-    for i in range(len(protein_sequence_hp)):
+    # Draw H-H contacts (non-bonded) as a second collection of dashed segments
+    coord_to_idx = {pack(x, y): i for i, (x, y) in enumerate(zip(x_coords, y_coords))}
+    contact_segments = []
+    for i, (x, y) in enumerate(zip(x_coords, y_coords)):
         if protein_sequence_hp[i] == 1:
-            current_h_coord = path[i]
-            for neighbor_coord in get_neighbors(current_h_coord[0], current_h_coord[1]):
-                if neighbor_coord in h_coords:
-                    neighbor_idx = path.index(neighbor_coord)
-                    if neighbor_idx > i and abs(i - neighbor_idx) > 1:
-                        # Draw a dashed line for the contact
-                        plt.plot([current_h_coord[0], neighbor_coord[0]],
-                                 [current_h_coord[1], neighbor_coord[1]], 'g--', linewidth=0.5)
+            for dx, dy in _OFFSETS:
+                neighbor_idx = coord_to_idx.get(pack(x + dx, y + dy), -1)
+                if neighbor_idx > i + 1 and protein_sequence_hp[neighbor_idx] == 1:
+                    contact_segments.append([(x, y), (x + dx, y + dy)])
+    if contact_segments:
+        ax.add_collection(LineCollection(contact_segments, colors='g', linestyles='--', linewidths=0.5))
 
     plt.title(f"{title}\nEnergy: {energy}")
     plt.xlabel("X-coordinate")
@@ -255,7 +272,7 @@ def plot_protein(sequence_str, path, energy, title="Protein Fold"):
     plt.show()
 
 def plot_energy_history(energy_history):
-    """Plots the energy evolution over time."""
+    """Plots the energy evolution over time, from the (temperature, energy) history of simulated_annealing."""
     temperatures = [eh[0] for eh in energy_history]
     energies = [eh[1] for eh in energy_history]
 
@@ -306,19 +323,19 @@ if __name__ == "__main__":
     cooling_factor = 0.999 # Rate at which temperature decreases (e.g., geometric cooling)
     steps_at_each_temp = 50 * len(protein_sequence) # More steps for larger proteins
 
-    best_fold_path, min_energy, history = simulated_annealing(
+    best_xs, best_ys, min_energy, history = simulated_annealing(
         protein_sequence, initial_T, final_T, cooling_factor, steps_at_each_temp
     )
 
     print(f"\n--- SA Results for {protein_sequence} ---")
-    print(f"Best path found: {best_fold_path}")
+    print(f"Best path found: {list(zip(best_xs.tolist(), best_ys.tolist()))}")
     print(f"Minimum energy found: {min_energy}")
     
     # Plot the best fold found
-    if best_fold_path and is_valid_path(best_fold_path):
-        plot_protein(protein_sequence, best_fold_path, min_energy, "Best Fold (Simulated Annealing)")
+    if best_xs.size and is_valid_path(best_xs, best_ys):
+        plot_protein(protein_sequence, best_xs, best_ys, min_energy, "Best Fold (Simulated Annealing)")
     else:
         print("Could not find a valid best fold to plot.")
 
     # Plot the energy and temperature history
-    plot_energy_history(history)
\ No newline at end of file
+    plot_energy_history(history)
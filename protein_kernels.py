@@ -0,0 +1,351 @@
+"""
+Numba-compiled kernels behind protein.simulated_annealing(backend='numba') and protein.parallel_tempering.
+Kept apart from protein.py so the rest of the module, and the sa_core backend, work without Numba installed.
+"""
+import math
+
+import numpy as np
+from numba import njit, prange, types
+from numba.typed import Dict, List
+
+# (dx, dy) offsets of the adjacent cells on a 2D square lattice, in the same order as protein.py
+_OFFSETS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+# Lattice rotation matrices by 0, 90, 180 and 270 degrees counter-clockwise
+_ROTATIONS = np.array([
+    [[1, 0], [0, 1]],
+    [[0, -1], [1, 0]],
+    [[-1, 0], [0, -1]],
+    [[0, 1], [-1, 0]],
+], dtype=np.int16)
+
+@njit(cache=True)
+def _pack(x, y):
+    """Packs a lattice coordinate into a single int64 occupancy key (same layout as protein.pack_coords)."""
+    return (np.int64(x) << 16) | (np.int64(y) & 0xFFFF)
+
+@njit(cache=True)
+def _occupant(occupancy, key, default):
+    """Returns the residue index at a packed coordinate, or `default` if the site is empty."""
+    if key in occupancy:
+        return occupancy[key]
+    return default
+
+@njit(cache=True)
+def contacts_involving(start, stop, protein_sequence_hp, xs, ys, occupancy):
+    """
+    Counts the non-bonded H-H contacts with at least one endpoint in [start, stop).
+    Used to compute the energy change of a move from only the residues it touched.
+    `occupancy` maps packed coordinates to residue indices; only the coordinates of
+    residues in [start, stop) are read from xs/ys.
+    """
+    contacts = 0
+    for i in range(start, stop):
+        if protein_sequence_hp[i] == 1:
+            for dx, dy in _OFFSETS:
+                neighbor_idx = _occupant(occupancy, _pack(xs[i] + dx, ys[i] + dy), -1)
+                # Non-bonded partners above i are always counted; partners below i only if they
+                # lie before the range, since pairs inside it are counted from the lower index
+                if ((neighbor_idx > i + 1 or 0 <= neighbor_idx < min(i - 1, start))
+                        and protein_sequence_hp[neighbor_idx] == 1):
+                    contacts += 1
+    return contacts
+
+@njit(cache=True)
+def _build_occupancy(xs, ys):
+    """Maps the packed coordinate of every residue to its index."""
+    occupancy = Dict.empty(key_type=types.int64, value_type=types.int64)
+    for i in range(xs.size):
+        occupancy[_pack(xs[i], ys[i])] = i
+    return occupancy
+
+# Move types proposed by _metropolis_sweep
+_END_FLIP, _CORNER_FLIP, _CRANKSHAFT, _PIVOT_ROTATE = 0, 1, 2, 3
+
+@njit(cache=True)
+def _is_free(occupancy, x, y, start, stop):
+    """True if (x, y) is empty or held by a residue in [start, stop), i.e. one that is moving too."""
+    occupant = _occupant(occupancy, _pack(x, y), -1)
+    return occupant < 0 or start <= occupant < stop
+
+@njit(cache=True)
+def end_flip(xs, ys, occupancy, choice, proposed_xs, proposed_ys):
+    """
+    Moves an end residue to another free site next to its bonded neighbor.
+    `choice` in [0, 6) selects the end (choice // 3) and which of the 3 other sites to use (choice % 3).
+    
+    Returns:
+        tuple: (start, stop) range of moved residues, written to proposed_xs/proposed_ys;
+        an empty range if the move is invalid.
+    """
+    num_residues = xs.size
+    end_idx = 0 if choice < 3 else num_residues - 1
+    anchor_idx = 1 if end_idx == 0 else num_residues - 2
+    anchor_x, anchor_y = xs[anchor_idx], ys[anchor_idx]
+
+    # Offset of the end from its anchor, then one of the other three offsets
+    current = 0
+    for k in range(4):
+        if anchor_x + _OFFSETS[k][0] == xs[end_idx] and anchor_y + _OFFSETS[k][1] == ys[end_idx]:
+            current = k
+    dx, dy = _OFFSETS[(current + 1 + choice % 3) % 4]
+    new_x, new_y = anchor_x + dx, anchor_y + dy
+    if not _is_free(occupancy, new_x, new_y, end_idx, end_idx + 1):
+        return 0, 0
+    proposed_xs[end_idx] = new_x
+    proposed_ys[end_idx] = new_y
+    return end_idx, end_idx + 1
+
+@njit(cache=True)
+def corner_flip(xs, ys, occupancy, residue_idx, proposed_xs, proposed_ys):
+    """
+    Flips an inner residue that sits on a corner to the opposite corner of its square.
+    
+    Returns:
+        tuple: (start, stop) range of moved residues, written to proposed_xs/proposed_ys;
+        an empty range if the move is invalid.
+    """
+    prev_x, prev_y = xs[residue_idx - 1], ys[residue_idx - 1]
+    next_x, next_y = xs[residue_idx + 1], ys[residue_idx + 1]
+    # Straight segments have no corner to flip
+    if prev_x == next_x or prev_y == next_y:
+        return 0, 0
+    new_x = prev_x + next_x - xs[residue_idx]
+    new_y = prev_y + next_y - ys[residue_idx]
+    if not _is_free(occupancy, new_x, new_y, residue_idx, residue_idx + 1):
+        return 0, 0
+    proposed_xs[residue_idx] = new_x
+    proposed_ys[residue_idx] = new_y
+    return residue_idx, residue_idx + 1
+
+@njit(cache=True)
+def crankshaft(xs, ys, occupancy, residue_idx, proposed_xs, proposed_ys):
+    """
+    Flips the 2-residue U-turn [residue_idx, residue_idx + 2) to the other side of the bond
+    axis through its two neighbors.
+    
+    Returns:
+        tuple: (start, stop) range of moved residues, written to proposed_xs/proposed_ys;
+        an empty range if the move is invalid.
+    """
+    if residue_idx + 2 >= xs.size:
+        return 0, 0
+    before_x, before_y = xs[residue_idx - 1], ys[residue_idx - 1]
+    after_x, after_y = xs[residue_idx + 2], ys[residue_idx + 2]
+    # Only a U-turn, whose ends are lattice neighbors, can be cranked
+    if abs(before_x - after_x) + abs(before_y - after_y) != 1:
+        return 0, 0
+    first_x, first_y = 2 * before_x - xs[residue_idx], 2 * before_y - ys[residue_idx]
+    second_x, second_y = 2 * after_x - xs[residue_idx + 1], 2 * after_y - ys[residue_idx + 1]
+    if not (_is_free(occupancy, first_x, first_y, residue_idx, residue_idx + 2)
+            and _is_free(occupancy, second_x, second_y, residue_idx, residue_idx + 2)):
+        return 0, 0
+    proposed_xs[residue_idx], proposed_ys[residue_idx] = first_x, first_y
+    proposed_xs[residue_idx + 1], proposed_ys[residue_idx + 1] = second_x, second_y
+    return residue_idx, residue_idx + 2
+
+@njit(cache=True)
+def pivot_rotate(xs, ys, occupancy, pivot_idx, choice, proposed_xs, proposed_ys):
+    """
+    Rotates the tail after `pivot_idx` around it by 90, 180 or 270 degrees (`choice` % 3 selects which).
+    A rigid rotation keeps the tail connected and free of self-intersections,
+    so the move is valid as long as no rotated residue lands on the prefix.
+    
+    Returns:
+        tuple: (start, stop) range of moved residues, written to proposed_xs/proposed_ys;
+        an empty range if the move is invalid.
+    """
+    num_residues = xs.size
+    pivot_x, pivot_y = xs[pivot_idx], ys[pivot_idx]
+    rotation = _ROTATIONS[1 + choice % 3] # Skip the identity
+    for i in range(pivot_idx + 1, num_residues):
+        rel_x, rel_y = xs[i] - pivot_x, ys[i] - pivot_y
+        new_x = pivot_x + rotation[0, 0] * rel_x + rotation[0, 1] * rel_y
+        new_y = pivot_y + rotation[1, 0] * rel_x + rotation[1, 1] * rel_y
+        if not _is_free(occupancy, new_x, new_y, pivot_idx + 1, num_residues):
+            return 0, 0
+        proposed_xs[i] = new_x
+        proposed_ys[i] = new_y
+    return pivot_idx + 1, num_residues
+
+@njit(cache=True)
+def _metropolis_sweep(protein_sequence_hp, xs, ys, occupancy, energy, temperature, steps,
+                      proposed_xs, proposed_ys, best_xs, best_ys, best_energy):
+    """
+    Runs `steps` Metropolis steps at a fixed temperature, each proposing an end flip, corner flip,
+    crankshaft or pivot rotation with equal probability.
+    xs/ys, occupancy and best_xs/best_ys are updated in place; proposed_xs/proposed_ys are scratch space.
+    
+    Returns:
+        tuple: (energy, best_energy) after the sweep.
+    """
+    num_residues = xs.size
+    # Chains shorter than 3 have no inner residue to move around and no possible contacts
+    if num_residues < 3:
+        return energy, best_energy
+
+    # Draw the random numbers for the whole sweep up front
+    moves = np.random.randint(0, 4, steps)
+    residues = np.random.randint(1, num_residues - 1, steps) # Exclude ends
+    choices = np.random.randint(0, 6, steps)
+    uniforms = np.random.random(steps)
+
+    # The current configuration is a new best that has not been copied to best_xs/best_ys yet.
+    # Copying is deferred until the chain is about to climb out of it, so a long descent costs one copy.
+    best_pending = False
+
+    for step in range(steps):
+        move = moves[step]
+        if move == _END_FLIP:
+            start, stop = end_flip(xs, ys, occupancy, choices[step], proposed_xs, proposed_ys)
+        elif move == _CORNER_FLIP:
+            start, stop = corner_flip(xs, ys, occupancy, residues[step], proposed_xs, proposed_ys)
+        elif move == _CRANKSHAFT:
+            start, stop = crankshaft(xs, ys, occupancy, residues[step], proposed_xs, proposed_ys)
+        else:
+            start, stop = pivot_rotate(xs, ys, occupancy, residues[step], choices[step], proposed_xs, proposed_ys)
+        if start == stop:
+            # The move would self-intersect or does not apply here, skip it
+            continue
+
+        # Only contacts involving the moved residues can change
+        old_contacts = contacts_involving(start, stop, protein_sequence_hp, xs, ys, occupancy)
+        for i in range(start, stop):
+            occupancy.pop(_pack(xs[i], ys[i]))
+        for i in range(start, stop):
+            occupancy[_pack(proposed_xs[i], proposed_ys[i])] = i
+        new_contacts = contacts_involving(start, stop, protein_sequence_hp, proposed_xs, proposed_ys, occupancy)
+        delta_e = old_contacts - new_contacts
+
+        # Metropolis criterion
+        if delta_e < 0:
+            accept = True
+        elif temperature > 0:
+            accept = uniforms[step] < math.exp(-delta_e / temperature)
+        else:
+            accept = False
+
+        if accept:
+            if best_pending and delta_e > 0:
+                best_xs[:] = xs
+                best_ys[:] = ys
+                best_pending = False
+            xs[start:stop] = proposed_xs[start:stop]
+            ys[start:stop] = proposed_ys[start:stop]
+            energy += delta_e
+            if energy < best_energy:
+                best_energy = energy
+                best_pending = True
+        else:
+            # Revert the occupancy map to the current (unmoved) residues
+            for i in range(start, stop):
+                occupancy.pop(_pack(proposed_xs[i], proposed_ys[i]))
+            for i in range(start, stop):
+                occupancy[_pack(xs[i], ys[i])] = i
+
+    if best_pending:
+        best_xs[:] = xs
+        best_ys[:] = ys
+    return energy, best_energy
+
+@njit(cache=True)
+def sa_kernel(protein_sequence_hp, xs, ys, initial_temperature, final_temperature, cooling_rate, steps_per_temp, seed):
+    """
+    Compiled annealing loop of simulated_annealing, working on int16 coordinate arrays.
+    
+    Returns:
+        tuple: (best_xs, best_ys, best_energy, energy_history) where energy_history is an
+        (n_temperatures, 2) array of (temperature, current_energy) rows.
+    """
+    np.random.seed(seed)
+    num_residues = xs.size
+    current_xs, current_ys = xs.copy(), ys.copy()
+
+    # Residue index of every occupied lattice site, kept in sync with current_xs/current_ys
+    occupancy = _build_occupancy(current_xs, current_ys)
+    current_energy = -contacts_involving(0, num_residues, protein_sequence_hp, current_xs, current_ys, occupancy)
+
+    best_xs, best_ys = current_xs.copy(), current_ys.copy()
+    best_energy = current_energy
+
+    num_temperatures = 0
+    temperature = initial_temperature
+    while temperature > final_temperature:
+        num_temperatures += 1
+        temperature *= cooling_rate
+    energy_history = np.empty((num_temperatures, 2))
+
+    proposed_xs = np.empty(num_residues, dtype=np.int16)
+    proposed_ys = np.empty(num_residues, dtype=np.int16)
+
+    temperature = initial_temperature
+    for t in range(num_temperatures):
+        current_energy, best_energy = _metropolis_sweep(
+            protein_sequence_hp, current_xs, current_ys, occupancy, current_energy, temperature,
+            steps_per_temp, proposed_xs, proposed_ys, best_xs, best_ys, best_energy
+        )
+        energy_history[t, 0] = temperature
+        energy_history[t, 1] = current_energy
+        temperature *= cooling_rate # Cool down
+
+    return best_xs, best_ys, best_energy, energy_history
+
+@njit(cache=True, parallel=True)
+def pt_kernel(protein_sequence_hp, replica_xs, replica_ys, temperatures, sweeps, swap_every, seed):
+    """
+    Compiled replica-exchange loop of parallel_tempering.
+    Each row of replica_xs/replica_ys is one replica, simulated at the matching entry of `temperatures`.
+    Replicas run `swap_every` Metropolis steps in parallel, then neighboring temperatures
+    attempt to exchange configurations in a sequential pass.
+    Every replica sweep and every exchange pass reseeds the RNG of the thread running it from
+    (seed, sweep, replica), so a run is reproducible whatever the thread count or schedule.
+    
+    Returns:
+        tuple: (best_xs, best_ys, best_energy, energy_history) where energy_history is a
+        (sweeps, n_replicas) array of the energy at each temperature after every sweep.
+    """
+    num_replicas, num_residues = replica_xs.shape
+    replica_xs, replica_ys = replica_xs.copy(), replica_ys.copy()
+
+    # Each row keeps its own occupancy map, proposal scratch and best configuration for the whole run.
+    # Exchanges only permute `slots` (the row simulated at each temperature), so no coordinates are copied.
+    slots = np.arange(num_replicas)
+    occupancies = List()
+    energies = np.empty(num_replicas, dtype=np.int64)
+    for row in range(num_replicas):
+        occupancies.append(_build_occupancy(replica_xs[row], replica_ys[row]))
+        energies[row] = -contacts_involving(0, num_residues, protein_sequence_hp,
+                                            replica_xs[row], replica_ys[row], occupancies[row])
+    best_xs, best_ys = replica_xs.copy(), replica_ys.copy()
+    best_energies = energies.copy()
+
+    proposed_xs = np.empty_like(replica_xs)
+    proposed_ys = np.empty_like(replica_ys)
+    energy_history = np.empty((sweeps, num_replicas), dtype=np.int64)
+
+    for sweep in range(sweeps):
+        # Seeds seed_base + r for the replicas and seed_base + num_replicas for the exchange pass
+        seed_base = seed + sweep * (num_replicas + 1)
+        for r in prange(num_replicas):
+            # Numba keeps one RNG state per thread, so seeding once up front would only fix the calling thread's
+            np.random.seed((seed_base + r) % 2**32)
+            row = slots[r]
+            energies[row], best_energies[row] = _metropolis_sweep(
+                protein_sequence_hp, replica_xs[row], replica_ys[row], occupancies[row], energies[row],
+                temperatures[r], swap_every, proposed_xs[row], proposed_ys[row],
+                best_xs[row], best_ys[row], best_energies[row]
+            )
+
+        np.random.seed((seed_base + num_replicas) % 2**32)
+        # Replica exchange between neighboring temperatures:
+        # accept with probability min(1, exp((1/T_i - 1/T_{i+1}) * (E_i - E_{i+1})))
+        for i in range(num_replicas - 1):
+            delta = (1.0 / temperatures[i] - 1.0 / temperatures[i + 1]) * (energies[slots[i]] - energies[slots[i + 1]])
+            if delta >= 0 or np.random.random() < math.exp(delta):
+                slots[i], slots[i + 1] = slots[i + 1], slots[i]
+
+        for r in range(num_replicas):
+            energy_history[sweep, r] = energies[slots[r]]
+
+    best = np.argmin(best_energies)
+    return best_xs[best].copy(), best_ys[best].copy(), best_energies[best], energy_history
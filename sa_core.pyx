@@ -0,0 +1,376 @@
+# cython: language_level=3, boundscheck=False, wraparound=False, cdivision=True, initializedcheck=False
+"""
+Ahead-of-time compiled counterpart of the Numba simulated annealing kernel in protein_kernels.py.
+Same move set, incremental energy and Metropolis loop, but built as a C extension so it needs
+no JIT warm-up and no Numba/LLVM at runtime. Build with `python setup.py build_ext --inplace`.
+"""
+import numpy as np
+
+from libc.math cimport exp
+from libc.stdint cimport int8_t, int16_t, int32_t, int64_t, uint32_t, uint64_t
+from libc.stdlib cimport abs as c_abs
+
+# Move types, in the same order as protein_kernels.py
+cdef enum:
+    END_FLIP = 0
+    CORNER_FLIP = 1
+    CRANKSHAFT = 2
+    PIVOT_ROTATE = 3
+
+cdef int[4] OFFSET_X = [1, -1, 0, 0]
+cdef int[4] OFFSET_Y = [0, 0, 1, -1]
+
+# Lattice rotation matrices by 90, 180 and 270 degrees counter-clockwise, row-major
+cdef int[12] ROTATIONS = [0, -1, 1, 0,
+                          -1, 0, 0, -1,
+                          0, 1, -1, 0]
+
+# --- Occupancy map: open-addressed packed coordinate -> residue index table ---
+
+cdef struct Occupancy:
+    uint32_t *keys
+    int32_t *values # -1 marks an empty slot
+    int bits
+    uint64_t mask
+
+cdef inline uint32_t _pack(int x, int y) noexcept nogil:
+    """Packs a lattice coordinate into one key (same layout as protein.pack, truncated to 32 bits)."""
+    return ((<uint32_t>x & 0xFFFF) << 16) | (<uint32_t>y & 0xFFFF)
+
+cdef inline uint64_t _home(const Occupancy *occ, uint32_t key) noexcept nogil:
+    # Fibonacci hashing: the top `bits` bits of the product are well mixed
+    return (<uint64_t>key * 0x9E3779B97F4A7C15ULL) >> (64 - occ.bits)
+
+cdef inline int _occupant(const Occupancy *occ, int x, int y) noexcept nogil:
+    """Returns the residue index at (x, y), or -1 if the site is empty."""
+    cdef uint32_t key = _pack(x, y)
+    cdef uint64_t i = _home(occ, key)
+    while occ.values[i] != -1:
+        if occ.keys[i] == key:
+            return occ.values[i]
+        i = (i + 1) & occ.mask
+    return -1
+
+cdef inline void _put(Occupancy *occ, int x, int y, int value) noexcept nogil:
+    cdef uint32_t key = _pack(x, y)
+    cdef uint64_t i = _home(occ, key)
+    while occ.values[i] != -1 and occ.keys[i] != key:
+        i = (i + 1) & occ.mask
+    occ.keys[i] = key
+    occ.values[i] = value
+
+cdef inline void _remove(Occupancy *occ, int x, int y) noexcept nogil:
+    """Removes (x, y) with backward-shift deletion, so lookups never need tombstones."""
+    cdef uint32_t key = _pack(x, y)
+    cdef uint64_t i = _home(occ, key)
+    cdef uint64_t j, home
+    while occ.values[i] != -1 and occ.keys[i] != key:
+        i = (i + 1) & occ.mask
+    if occ.values[i] == -1:
+        return
+    j = i
+    while True:
+        j = (j + 1) & occ.mask
+        if occ.values[j] == -1:
+            break
+        home = _home(occ, occ.keys[j])
+        # The entry at j may fill the hole at i unless its home lies cyclically in (i, j]
+        if (j > i and (home <= i or home > j)) or (j < i and home <= i and home > j):
+            occ.keys[i] = occ.keys[j]
+            occ.values[i] = occ.values[j]
+            i = j
+    occ.values[i] = -1
+
+cdef inline bint _is_free(const Occupancy *occ, int x, int y, int start, int stop) noexcept nogil:
+    """True if (x, y) is empty or held by a residue in [start, stop), i.e. one that is moving too."""
+    cdef int occupant = _occupant(occ, x, y)
+    return occupant < 0 or (start <= occupant < stop)
+
+# --- Random numbers: xorshift64* ---
+
+cdef inline uint64_t _next(uint64_t *state) noexcept nogil:
+    state[0] ^= state[0] >> 12
+    state[0] ^= state[0] << 25
+    state[0] ^= state[0] >> 27
+    return state[0] * 0x2545F4914F6CDD1DULL
+
+cdef inline double _uniform(uint64_t *state) noexcept nogil:
+    return (_next(state) >> 11) * (1.0 / 9007199254740992.0)
+
+cdef inline int _randint(uint64_t *state, int low, int high) noexcept nogil:
+    """Uniform integer in [low, high)."""
+    return low + <int>(_next(state) % <uint64_t>(high - low))
+
+# --- Energy and moves ---
+
+cdef int _contacts_involving(int start, int stop, const int8_t[::1] hp,
+                             const int16_t[::1] xs, const int16_t[::1] ys, const Occupancy *occ) noexcept nogil:
+    """Counts the non-bonded H-H contacts with at least one endpoint in [start, stop)."""
+    cdef int contacts = 0
+    cdef int i, k, neighbor_idx, lower
+    for i in range(start, stop):
+        if hp[i] == 1:
+            lower = i - 1 if i - 1 < start else start
+            for k in range(4):
+                neighbor_idx = _occupant(occ, xs[i] + OFFSET_X[k], ys[i] + OFFSET_Y[k])
+                if (neighbor_idx > i + 1 or 0 <= neighbor_idx < lower) and hp[neighbor_idx] == 1:
+                    contacts += 1
+    return contacts
+
+cdef bint _end_flip(const int16_t[::1] xs, const int16_t[::1] ys, const Occupancy *occ, int choice,
+                    int16_t[::1] pxs, int16_t[::1] pys, int *start, int *stop) noexcept nogil:
+    cdef int n = xs.shape[0]
+    cdef int end_idx = 0 if choice < 3 else n - 1
+    cdef int anchor_idx = 1 if end_idx == 0 else n - 2
+    cdef int ax = xs[anchor_idx], ay = ys[anchor_idx]
+    cdef int current = 0, k, nx, ny
+    for k in range(4):
+        if ax + OFFSET_X[k] == xs[end_idx] and ay + OFFSET_Y[k] == ys[end_idx]:
+            current = k
+    k = (current + 1 + choice % 3) % 4
+    nx = ax + OFFSET_X[k]
+    ny = ay + OFFSET_Y[k]
+    if not _is_free(occ, nx, ny, end_idx, end_idx + 1):
+        return False
+    pxs[end_idx] = nx
+    pys[end_idx] = ny
+    start[0] = end_idx
+    stop[0] = end_idx + 1
+    return True
+
+cdef bint _corner_flip(const int16_t[::1] xs, const int16_t[::1] ys, const Occupancy *occ, int idx,
+                       int16_t[::1] pxs, int16_t[::1] pys, int *start, int *stop) noexcept nogil:
+    cdef int prev_x = xs[idx - 1], prev_y = ys[idx - 1]
+    cdef int next_x = xs[idx + 1], next_y = ys[idx + 1]
+    cdef int nx, ny
+    if prev_x == next_x or prev_y == next_y:
+        return False
+    nx = prev_x + next_x - xs[idx]
+    ny = prev_y + next_y - ys[idx]
+    if not _is_free(occ, nx, ny, idx, idx + 1):
+        return False
+    pxs[idx] = nx
+    pys[idx] = ny
+    start[0] = idx
+    stop[0] = idx + 1
+    return True
+
+cdef bint _crankshaft(const int16_t[::1] xs, const int16_t[::1] ys, const Occupancy *occ, int idx,
+                      int16_t[::1] pxs, int16_t[::1] pys, int *start, int *stop) noexcept nogil:
+    cdef int bx, by, ax, ay, x1, y1, x2, y2
+    if idx + 2 >= xs.shape[0]:
+        return False
+    bx = xs[idx - 1]
+    by = ys[idx - 1]
+    ax = xs[idx + 2]
+    ay = ys[idx + 2]
+    if c_abs(bx - ax) + c_abs(by - ay) != 1:
+        return False
+    x1 = 2 * bx - xs[idx]
+    y1 = 2 * by - ys[idx]
+    x2 = 2 * ax - xs[idx + 1]
+    y2 = 2 * ay - ys[idx + 1]
+    if not (_is_free(occ, x1, y1, idx, idx + 2) and _is_free(occ, x2, y2, idx, idx + 2)):
+        return False
+    pxs[idx] = x1
+    pys[idx] = y1
+    pxs[idx + 1] = x2
+    pys[idx + 1] = y2
+    start[0] = idx
+    stop[0] = idx + 2
+    return True
+
+cdef bint _pivot_rotate(const int16_t[::1] xs, const int16_t[::1] ys, const Occupancy *occ, int pivot, int choice,
+                        int16_t[::1] pxs, int16_t[::1] pys, int *start, int *stop) noexcept nogil:
+    cdef int n = xs.shape[0]
+    cdef int px = xs[pivot], py = ys[pivot]
+    cdef int *rotation = &ROTATIONS[4 * (choice % 3)]
+    cdef int k, rx, ry, nx, ny
+    for k in range(pivot + 1, n):
+        rx = xs[k] - px
+        ry = ys[k] - py
+        nx = px + rotation[0] * rx + rotation[1] * ry
+        ny = py + rotation[2] * rx + rotation[3] * ry
+        if not _is_free(occ, nx, ny, pivot + 1, n):
+            return False
+        pxs[k] = nx
+        pys[k] = ny
+    start[0] = pivot + 1
+    stop[0] = n
+    return True
+
+cdef int64_t sa_sweep(const int8_t[::1] hp, int16_t[::1] xs, int16_t[::1] ys, Occupancy *occ,
+                      int64_t energy, double temperature, int steps, uint64_t *rng,
+                      int16_t[::1] pxs, int16_t[::1] pys,
+                      int16_t[::1] best_xs, int16_t[::1] best_ys, int64_t *best_energy) noexcept nogil:
+    """Runs `steps` Metropolis steps at a fixed temperature; returns the new current energy."""
+    cdef int n = xs.shape[0]
+    cdef int step, move, idx, choice, start = 0, stop = 0, i
+    cdef int64_t delta_e
+    cdef bint valid, accept, best_pending = False
+    if n < 3:
+        return energy
+
+    for step in range(steps):
+        move = _randint(rng, 0, 4)
+        idx = _randint(rng, 1, n - 1)
+        choice = _randint(rng, 0, 6)
+        if move == END_FLIP:
+            valid = _end_flip(xs, ys, occ, choice, pxs, pys, &start, &stop)
+        elif move == CORNER_FLIP:
+            valid = _corner_flip(xs, ys, occ, idx, pxs, pys, &start, &stop)
+        elif move == CRANKSHAFT:
+            valid = _crankshaft(xs, ys, occ, idx, pxs, pys, &start, &stop)
+        else:
+            valid = _pivot_rotate(xs, ys, occ, idx, choice, pxs, pys, &start, &stop)
+        if not valid:
+            continue
+
+        # Only contacts involving the moved residues can change
+        delta_e = _contacts_involving(start, stop, hp, xs, ys, occ)
+        for i in range(start, stop):
+            _remove(occ, xs[i], ys[i])
+        for i in range(start, stop):
+            _put(occ, pxs[i], pys[i], i)
+        delta_e -= _contacts_involving(start, stop, hp, pxs, pys, occ)
+
+        # Metropolis criterion
+        if delta_e < 0:
+            accept = True
+        elif temperature > 0:
+            accept = _uniform(rng) < exp(-delta_e / temperature)
+        else:
+            accept = False
+
+        if accept:
+            # Copy a new best only once the chain is about to climb out of it
+            if best_pending and delta_e > 0:
+                best_xs[:] = xs
+                best_ys[:] = ys
+                best_pending = False
+            for i in range(start, stop):
+                xs[i] = pxs[i]
+                ys[i] = pys[i]
+            energy += delta_e
+            if energy < best_energy[0]:
+                best_energy[0] = energy
+                best_pending = True
+        else:
+            for i in range(start, stop):
+                _remove(occ, pxs[i], pys[i])
+            for i in range(start, stop):
+                _put(occ, xs[i], ys[i], i)
+
+    if best_pending:
+        best_xs[:] = xs
+        best_ys[:] = ys
+    return energy
+
+cdef _new_occupancy(Occupancy *occ, const int16_t[::1] xs, const int16_t[::1] ys):
+    """
+    Allocates a table of at least 4n slots (load factor at most 1/4), fills it with xs/ys and binds it to occ.
+    Returns the backing arrays, which must stay referenced while occ is in use.
+    """
+    cdef int n = xs.shape[0]
+    cdef int bits = 4
+    while (1 << bits) < 4 * n:
+        bits += 1
+    keys_array = np.zeros(1 << bits, dtype=np.uint32)
+    values_array = np.full(1 << bits, -1, dtype=np.int32)
+    cdef uint32_t[::1] keys = keys_array
+    cdef int32_t[::1] values = values_array
+    occ.keys = &keys[0]
+    occ.values = &values[0]
+    occ.bits = bits
+    occ.mask = (1 << bits) - 1
+
+    cdef int i
+    for i in range(n):
+        _put(occ, xs[i], ys[i], i)
+    return keys_array, values_array
+
+cdef inline uint64_t _seed_state(seed):
+    # Any Python int is accepted as a seed; it is reduced to 64 bits before the cast
+    return (<uint64_t>(seed & 0xFFFFFFFFFFFFFFFF) * 0x9E3779B97F4A7C15ULL) | 1 # xorshift state must be non-zero
+
+def metropolis_sweep(protein_sequence_hp, xs, ys, double temperature, int steps, seed):
+    """
+    Runs `steps` Metropolis steps at a fixed temperature on xs/ys in place (contiguous int16 arrays).
+    Exposes the kernel's current state and occupancy table for invariant tests.
+
+    Returns:
+        tuple: (energy, occupancy_ok) where occupancy_ok is True if the table holds exactly
+        one entry per residue, at that residue's coordinate.
+    """
+    cdef const int8_t[::1] hp = np.ascontiguousarray(protein_sequence_hp, dtype=np.int8)
+    cdef int16_t[::1] current_xs = xs
+    cdef int16_t[::1] current_ys = ys
+    cdef int n = current_xs.shape[0]
+    cdef int16_t[::1] pxs = np.empty(n, dtype=np.int16)
+    cdef int16_t[::1] pys = np.empty(n, dtype=np.int16)
+    cdef int16_t[::1] best_xs = np.array(current_xs)
+    cdef int16_t[::1] best_ys = np.array(current_ys)
+    cdef Occupancy occ
+    table = _new_occupancy(&occ, current_xs, current_ys)
+    cdef uint64_t rng = _seed_state(seed)
+    cdef int64_t energy = -_contacts_involving(0, n, hp, current_xs, current_ys, &occ)
+    cdef int64_t best_energy = energy
+
+    energy = sa_sweep(hp, current_xs, current_ys, &occ, energy, temperature, steps, &rng,
+                      pxs, pys, best_xs, best_ys, &best_energy)
+
+    cdef int i, filled = 0
+    cdef bint occupancy_ok = True
+    for i in range(n):
+        if _occupant(&occ, current_xs[i], current_ys[i]) != i:
+            occupancy_ok = False
+    for i in range(<int>occ.mask + 1):
+        if occ.values[i] != -1:
+            filled += 1
+    return energy, occupancy_ok and filled == n
+
+def sa_kernel(protein_sequence_hp, xs, ys, double initial_temperature, double final_temperature,
+              double cooling_rate, int steps_per_temp, seed):
+    """
+    Drop-in replacement for protein_kernels.sa_kernel.
+
+    Returns:
+        tuple: (best_xs, best_ys, best_energy, energy_history) where energy_history is an
+        (n_temperatures, 2) array of (temperature, current_energy) rows.
+    """
+    cdef const int8_t[::1] hp = np.ascontiguousarray(protein_sequence_hp, dtype=np.int8)
+    cdef int16_t[::1] current_xs = np.array(xs, dtype=np.int16)
+    cdef int16_t[::1] current_ys = np.array(ys, dtype=np.int16)
+    cdef int n = current_xs.shape[0]
+    cdef int16_t[::1] pxs = np.empty(n, dtype=np.int16)
+    cdef int16_t[::1] pys = np.empty(n, dtype=np.int16)
+
+    cdef Occupancy occ
+    table = _new_occupancy(&occ, current_xs, current_ys)
+    cdef uint64_t rng = _seed_state(seed)
+    cdef int64_t energy = -_contacts_involving(0, n, hp, current_xs, current_ys, &occ)
+    cdef int64_t best_energy = energy
+    best_xs_array = np.array(current_xs)
+    best_ys_array = np.array(current_ys)
+    cdef int16_t[::1] best_xs = best_xs_array
+    cdef int16_t[::1] best_ys = best_ys_array
+
+    cdef int num_temperatures = 0
+    cdef double temperature = initial_temperature
+    while temperature > final_temperature:
+        num_temperatures += 1
+        temperature *= cooling_rate
+    history_array = np.empty((num_temperatures, 2))
+    cdef double[:, ::1] energy_history = history_array
+
+    cdef int t
+    temperature = initial_temperature
+    with nogil:
+        for t in range(num_temperatures):
+            energy = sa_sweep(hp, current_xs, current_ys, &occ, energy, temperature, steps_per_temp, &rng,
+                              pxs, pys, best_xs, best_ys, &best_energy)
+            energy_history[t, 0] = temperature
+            energy_history[t, 1] = energy
+            temperature *= cooling_rate # Cool down
+
+    return best_xs_array, best_ys_array, best_energy, history_array
@@ -0,0 +1,19 @@
+"""Builds the optional sa_core C extension: python setup.py build_ext --inplace"""
+import numpy as np
+from Cython.Build import cythonize
+from setuptools import Extension, setup
+
+setup(
+    name="protein-sa-core",
+    ext_modules=cythonize(
+        [
+            Extension(
+                "sa_core",
+                ["sa_core.pyx"],
+                include_dirs=[np.get_include()],
+                extra_compile_args=["-O3", "-march=native"],
+            )
+        ],
+        language_level=3,
+    ),
+)
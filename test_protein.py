@@ -0,0 +1,108 @@
+"""Invariant checks for the annealing kernels: valid paths, consistent energies and occupancy maps."""
+import random
+
+import numpy as np
+import pytest
+
+import protein
+
+
+def random_chain(rng, num_residues):
+    sequence_str = "".join(rng.choice("HP") for _ in range(num_residues))
+    xs, ys = protein.generate_random_path(num_residues, rng)
+    return protein.parse_sequence(sequence_str), xs, ys
+
+
+@pytest.mark.parametrize("num_residues", [3, 4, 5, 10, 30, 60])
+def test_metropolis_sweep_keeps_invariants(num_residues):
+    protein_kernels = pytest.importorskip("protein_kernels")
+    rng = random.Random(num_residues)
+    protein_sequence_hp, xs, ys = random_chain(rng, num_residues)
+    occupancy = protein_kernels._build_occupancy(xs, ys)
+    energy = protein.calculate_energy(protein_sequence_hp, xs, ys)
+    best_xs, best_ys, best_energy = xs.copy(), ys.copy(), energy
+    proposed_xs, proposed_ys = np.empty_like(xs), np.empty_like(ys)
+
+    for temperature in (2.0, 0.5, 0.1):
+        for _ in range(50):
+            energy, best_energy = protein_kernels._metropolis_sweep(
+                protein_sequence_hp, xs, ys, occupancy, energy, temperature, 50,
+                proposed_xs, proposed_ys, best_xs, best_ys, best_energy
+            )
+            assert protein.is_valid_path(xs, ys)
+            assert energy == protein.calculate_energy(protein_sequence_hp, xs, ys)
+            assert len(occupancy) == num_residues
+            for i, (x, y) in enumerate(zip(xs.tolist(), ys.tolist())):
+                assert occupancy[protein.pack(x, y)] == i
+
+    assert protein.is_valid_path(best_xs, best_ys)
+    assert best_energy == protein.calculate_energy(protein_sequence_hp, best_xs, best_ys)
+    assert best_energy <= energy
+
+
+@pytest.mark.parametrize("num_residues", [3, 4, 5, 10, 30, 60])
+def test_sa_core_sweep_keeps_invariants(num_residues):
+    sa_core = pytest.importorskip("sa_core")
+    rng = random.Random(num_residues)
+    hp, xs, ys = random_chain(rng, num_residues)
+
+    for seed, temperature in enumerate([2.0, 0.5, 0.1] * 50):
+        energy, occupancy_ok = sa_core.metropolis_sweep(hp, xs, ys, temperature, 50, seed - 75)
+        assert protein.is_valid_path(xs, ys)
+        assert energy == protein.calculate_energy(hp, xs, ys)
+        assert occupancy_ok
+
+
+@pytest.mark.parametrize("num_residues", [4, 30])
+def test_sa_core_kernel_returns_consistent_best(num_residues):
+    sa_core = pytest.importorskip("sa_core")
+    rng = random.Random(num_residues)
+    hp, xs, ys = random_chain(rng, num_residues)
+
+    best_xs, best_ys, best_energy, history = sa_core.sa_kernel(hp, xs, ys, 2.0, 0.1, 0.9, 100, num_residues)
+    assert protein.is_valid_path(best_xs, best_ys)
+    assert best_energy == protein.calculate_energy(hp, best_xs, best_ys)
+    assert best_energy <= history[:, 1].min()
+
+
+@pytest.mark.parametrize("num_residues, n_replicas", [(4, 2), (20, 3), (40, 6)])
+def test_parallel_tempering_returns_consistent_best(num_residues, n_replicas):
+    pytest.importorskip("protein_kernels")
+    rng = random.Random(num_residues)
+    sequence_str = "".join(rng.choice("HP") for _ in range(num_residues))
+    protein_sequence_hp = protein.parse_sequence(sequence_str)
+
+    best_xs, best_ys, best_energy, replica_energies = protein.parallel_tempering(
+        sequence_str, 0.2, 2.0, n_replicas=n_replicas, sweeps=40, swap_every=50, seed=num_residues
+    )
+    assert protein.is_valid_path(best_xs, best_ys)
+    assert best_energy == protein.calculate_energy(protein_sequence_hp, best_xs, best_ys)
+    assert best_energy <= replica_energies.min()
+    assert replica_energies.shape == (40, n_replicas)
+
+
+@pytest.mark.parametrize("num_residues", [1, 2, 3, 10, 50, 200, 500])
+def test_generate_random_path_is_valid_and_reproducible(num_residues):
+    for seed in range(5):
+        xs, ys = protein.generate_random_path(num_residues, random.Random(seed))
+        assert xs.dtype == ys.dtype == np.int16
+        assert xs.size == ys.size == num_residues
+        assert protein.is_valid_path(xs, ys)
+
+        again_xs, again_ys = protein.generate_random_path(num_residues, random.Random(seed))
+        assert np.array_equal(xs, again_xs) and np.array_equal(ys, again_ys)
+
+
+@pytest.mark.parametrize("sequence_str", ["HPPH", "hpPh", "HéPH", "HßPH", "H \U0001f600H", ""])
+def test_parse_sequence_has_one_entry_per_character(sequence_str):
+    expected = [1 if char in "Hh" else 0 for char in sequence_str]
+    assert protein.parse_sequence(sequence_str).tolist() == expected
+
+
+@pytest.mark.parametrize("seed", [0, -1, 2**32 + 7, 2**70, -(2**70)])
+def test_wrappers_accept_any_integer_seed(seed):
+    pytest.importorskip("protein_kernels")
+    best_xs, best_ys, _, _ = protein.simulated_annealing("HPHPPHHPHH", 1.0, 0.5, 0.9, 20, seed=seed)
+    assert protein.is_valid_path(best_xs, best_ys)
+    best_xs, best_ys, _, _ = protein.parallel_tempering("HPHPPHHPHH", 0.5, 1.0, 2, 5, 20, seed=seed)
+    assert protein.is_valid_path(best_xs, best_ys)